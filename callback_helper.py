@@ -4,10 +4,18 @@
 05.16.2017 tps Add test to skip blank URL.
 05.17.2017 tps Use integer status flags instead of strings to indicate upload status.
 06.14.2017 tps Added return status for upload failure due to file quota exceeded.
+10.14.2026 agt Build callback dictionary in a single call.
+10.14.2026 agt Port to Python 3.
+10.14.2026 agt Reuse HTTP connections for callbacks.
+10.14.2026 agt Add describe_exception().
+10.14.2026 agt Time out callback requests.
+10.14.2026 agt Add make_batched_callback_post().
+10.14.2026 agt Give callbacks a shorter timeout than Canvas requests.
 """
 
-# import canvas_api
-import requests
+import canvas_api
+import json_helper
+
 import traceback
 
 
@@ -19,28 +27,67 @@ STATUS_PENDING = 3
 STATUS_READY = 4
 STATUS_QUOTA_EXCEEDED = 5
 
+
+######## Timeout Constants ##########
+
+# Seconds to wait to connect to & hear back from the callback URL. The callback host only has
+# to acknowledge the POST, so don't keep the Lambda function running long waiting for it.
+CALLBACK_TIMEOUT = (3, 10)
+
+
+########### HTTP Session ###########
+
+# Callbacks for a batch of uploads usually go to the same host, so reuse connections to it.
+# The callback host isn't Canvas, so this session never carries the Canvas access token.
+_SESSION = canvas_api.TimeoutSession()
+
+
 def make_callback_dictionary(param_dict, status_flag, status_msg):
     """Utility function that adds extra return values to parameter dictionary."""
-    callback_dict = param_dict.copy()
-    callback_dict['status_flag'] = status_flag
-    callback_dict['status_msg'] = status_msg
-    return callback_dict
+    return dict(param_dict, status_flag=status_flag, status_msg=status_msg)
 
 def make_callback_post(callback_url, param_dict):
     """Utility function that makes the callback, which is an HTTP POST."""
 
     # It's OK to skip the callback altogether if the client didn't give us a callback URL.
-    if (callback_url is not None) and isinstance(callback_url, basestring) and (callback_url != ''):
-
-        # Swallow errors trying to reach callback URL. There's nothing we can do except try to log it.
-        try:
-            callback_resp = requests.post(callback_url, data=param_dict)
-            print('Callback URL: %s Status code: %s' % (callback_url, callback_resp.status_code))
-        except Exception as ex:
-            print('Error making callback:')
-            error_description = '\n'.join((
-                'Exception type: %s' % type(ex),
-                'Exception: %s' % ex,
-                traceback.format_exc()
-            ))
-            print(error_description)
\ No newline at end of file
+    if not callback_url:
+        return
+
+    # Swallow errors trying to reach callback URL. There's nothing we can do except try to log it.
+    try:
+        callback_resp = _SESSION.post(callback_url, data=param_dict, timeout=CALLBACK_TIMEOUT)
+        print('Callback URL: %s Status code: %s' % (callback_url, callback_resp.status_code))
+    except Exception as ex:
+        print('Error making callback:')
+        print(describe_exception(ex))
+
+def make_batched_callback_post(callback_url, callback_dicts):
+    """Utility function that reports several uploads to the callback URL in a single HTTP POST.
+    The POST has a batch=1 query parameter & a JSON body of the form {"results": [callback_dicts...]}.
+    If the callback URL doesn't accept it with a 2xx status, fall back on posting each result separately.
+    """
+    if not callback_url or not callback_dicts:
+        return
+
+    try:
+        callback_resp = _SESSION.post(callback_url, params={'batch': 1},
+            data=json_helper.dumps({'results': callback_dicts}), timeout=CALLBACK_TIMEOUT,
+            headers={'Content-Type': 'application/json'})
+        print('Batched callback URL: %s Status code: %s' % (callback_url, callback_resp.status_code))
+        if 200 <= callback_resp.status_code < 300:
+            return
+    except Exception as ex:
+        print('Error making batched callback:')
+        print(describe_exception(ex))
+
+    for callback_dict in callback_dicts:
+        make_callback_post(callback_url, callback_dict)
+
+def describe_exception(ex):
+    """Utility function that builds a description of an unexpected exception,
+    including its stack trace, for logging & reporting to the callback URL."""
+    return '\n'.join((
+        'Exception type: %s' % type(ex),
+        'Exception: %s' % ex,
+        ''.join(traceback.format_exception(type(ex), ex, ex.__traceback__))
+    ))
@@ -30,28 +30,136 @@ Initially hacked from https://github.com/unsupported/canvas/tree/master/api/pull
 06.14.2017 tps Add pull_quota_info() for testing.
 11.15.2018 tps Redo for changed behavior of Canvas API for file uploads.
 12.20.2018 tps Add custom exception for Canvas API upload error.
+10.14.2026 agt Reuse a single HTTP session so calls share keep-alive connections.
+10.14.2026 agt Add iter_endpoint() so user search can stop paging at the first match.
+10.14.2026 agt query_endpoint() requests remaining pages concurrently when the page count is known.
+10.14.2026 agt Port to Python 3. Build URLs with f-strings.
+10.14.2026 agt Add canvas_get_text().
+10.14.2026 agt Time out upload delegation request.
+10.14.2026 agt Add default timeout to all requests.
+10.14.2026 agt Decode responses with json_helper.
+10.14.2026 agt Add resolve_folder_path().
+10.14.2026 agt Raise TransientCanvasError for upload requests that fail in ways worth retrying.
+10.14.2026 agt Drop DELEGATION_TIMEOUT, which was the same as the default timeout.
+10.14.2026 agt Only treat upload failures as transient if Canvas can't have started the upload.
+10.14.2026 agt initiate_file_upload_via_url() can add Canvas's responses to the caller's log record.
+10.14.2026 agt Keep enough connections to Canvas for every polling thread.
+10.14.2026 agt pull_file() accepts a timeout for callers that can't wait long.
+10.14.2026 agt Only treat upload connection errors as transient if no connection was made.
+10.14.2026 agt pull_file() with a timeout makes a single try, so the timeout bounds the whole call.
+10.14.2026 agt canvas_get_text() accepts a timeout too.
 """
 
+import json_helper
+
 import requests         # http://docs.python-requests.org/
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from urllib3.util.retry import Retry
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
 ########### Endpoint constants ###########
 
 ACCESS_TOKEN = 'secretkey'  # Development
 BASE_URL = 'https://ourdomain.instructure.com/api/v1/'  # Production
-REQUEST_HEADERS = {'Authorization':'Bearer %s' % ACCESS_TOKEN}
+REQUEST_HEADERS = {'Authorization': f'Bearer {ACCESS_TOKEN}'}
 
 # Number of results to return per request.
 RESULTS_PER_PAGE = 1000
 
+# Maximum number of pages of results to request at the same time.
+PREFETCH_THREADS = 8
+
+# Maximum number of connections to Canvas the session keeps open, which is also
+# the most threads that should share it, like poll_canvas_upload.py's polling threads.
+# Connections beyond this are closed after each request instead of being reused.
+POOL_MAXSIZE = 32
+
+# Finds the page number query parameter in a paged result set's link URL.
+PAGE_NUMBER_RE = re.compile(r'([?&]page=)(\d+)(?=&|$)')
+
+# Seconds to wait to connect to & hear back from a server before giving up on a request.
+# Without a timeout, a stuck request could keep the Lambda function running until it times out.
+DEFAULT_TIMEOUT = (5, 30)
+
+# Status codes from a failed upload request that mean the request never reached a server
+# that could act on it, so it's safe to try again. Other 5xx responses, like 504 gateway
+# timeout, might come after Canvas started the upload.
+TRANSIENT_STATUS_CODES = (502, 503)
+
+# Upload URLs returned by Canvas aren't Canvas API endpoints, so
+# requests to them shouldn't carry our access token.
+UNAUTHENTICATED_HEADERS = {'Authorization': None}
+
+
+########### HTTP Session ###########
+
+class TimeoutSession(requests.Session):
+    """Session that applies DEFAULT_TIMEOUT to requests that don't specify their own timeout."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+# All Canvas API calls go through this session, so that TCP connections &
+# TLS handshakes are reused between requests to the same host, including
+# requests made in later invocations of a warm Lambda container.
+# Transient gateway errors are retried for idempotent requests.
+_SESSION = TimeoutSession()
+_SESSION.headers.update(REQUEST_HEADERS)
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=POOL_MAXSIZE,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False)))
+
+# Session for callers that need a request to give up within its timeout. Its
+# requests aren't retried, since retries would multiply how long they can take.
+_SINGLE_TRY_SESSION = TimeoutSession()
+_SINGLE_TRY_SESSION.headers.update(REQUEST_HEADERS)
+_SINGLE_TRY_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=POOL_MAXSIZE))
+
 
 ######## Custom Exceptions ##########
 
-class UploadDelegationException(Exception):
+class TransientCanvasError(Exception):
+    """Upload request failed before Canvas could have acted on it, such as failing to
+    connect or a 502 or 503 response, so it might succeed if tried again."""
+    pass
+
+class UploadDelegationException(TransientCanvasError):
+    pass
+
+class UploadRequestException(Exception):
+    """Upload request failed without telling us whether Canvas started the upload, such as
+    a read timeout, a dropped connection or a 504 response. Trying again could start a second transfer."""
     pass
 
 
 ######## Utility Functions ##########
 
+def _log_value(log_record, key, value):
+    """Add a value to the caller's log record, or print it if the caller didn't give one."""
+    if log_record is None:
+        print(f'{key}: {value}')
+    else:
+        log_record[key] = value
+
+def _is_connect_failure(ex):
+    """True if a requests ConnectionError happened before a connection to the
+    server was made, so the request can't have been sent.
+    Other connection errors, like the server closing the connection, can happen
+    after the server got the request.
+    """
+    if isinstance(ex, requests.exceptions.ConnectTimeout):
+        return True
+    reason = ex.args[0] if ex.args else None
+    return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+
 def query_endpoint(endpoint, request_params = {}):
     """Helper function to retrieve list of JSON objects from Canvas API endpoint.
 
@@ -60,7 +168,22 @@ def query_endpoint(endpoint, request_params = {}):
 
     Canvas API returns paged result sets, which is useful for Web apps but not
     really necessary here. To reduce number of API calls, I specify a large number 
-    of results per page.
+    of results per page. If there are still several pages, they are requested
+    at the same time when Canvas tells us how many pages there are.
+    """
+    return list(iter_endpoint(endpoint, request_params, prefetch=True))
+
+def iter_endpoint(endpoint, request_params = {}, prefetch = False):
+    """Generate the JSON objects from Canvas API endpoint, one page at a time.
+
+    endpoint - Endpoint portion of request URL.
+    request_params - Dictionary containing optional query parameters for request.
+    prefetch - If True, request all remaining pages concurrently after the 1st one,
+               when the response's Link header includes the last page.
+
+    Without prefetch, a page is only requested once the caller has used up the
+    previous page, so a caller that stops iterating early doesn't pay for the
+    remaining pages.
     """
 
     # Build full endpoint URL
@@ -74,43 +197,79 @@ def query_endpoint(endpoint, request_params = {}):
     # for key in request_params.keys():
     #     submission_params[key] = request_params[key]
 
-    # Return this list filled with JSON dictionaries from Canvas API call.
-    resp_data = []
+    # Results are paged, so we have to keep requesting until we get all of them.
+    while 1:
+        resp, resp_json = _get_page(endpoint_url, submission_params)
+        for item in _page_items(resp_json):
+            yield item
+
+        if prefetch:
+            page_urls = _remaining_page_urls(resp)
+            if page_urls is not None:
+                for page_json in _get_pages(page_urls, submission_params):
+                    for item in _page_items(page_json):
+                        yield item
+                break
+            prefetch = False    # Page count isn't known, so follow the next links.
+
+        if 'next' in resp.links:
+            endpoint_url = resp.links['next']['url']
+            # print(endpoint_url)
+        else:
+            break
 
+def _get_page(page_url, request_params = None, timeout = DEFAULT_TIMEOUT, session = _SESSION):
+    """Request one page of results from Canvas API.
+    Returns tuple of the response & its decoded JSON.
+    """
+    resp = None
     try:
-        # Results are paged, so we have to keep requesting until we get all of them.
-        while 1:
-            resp = requests.get(endpoint_url, params=submission_params, headers=REQUEST_HEADERS)
-            # print(resp.url)
-
-            # The response might be a list of JSON dictionaries or it may be a single
-            # JSON dictionary. If we have a list, we want to concatenate it to the
-            # result list. If we have a single JSON dictionary, we want to append it
-            # to the result list.
-            resp_json = resp.json()
-            if isinstance(resp_json, list):
-                resp_data += resp_json
-            else:
-                resp_data.append(resp_json)
-
-            # print "data count after page: %s" % len(resp_data)
-            if 'next' in resp.links.keys():
-                endpoint_url = resp.links['next']['url']
-                # print endpoint_url
-            else:
-                break
+        resp = session.get(page_url, params=request_params, timeout=timeout)
+        # print(resp.url)
+        return resp, json_helper.loads(resp.content)
 
     # If something bad happens while accessing Canvas API,
     # record the offending endpoint for debugging purposes.
     # A request error is catastrophic & there is no point in trying to continue.
     except Exception as ex:
-        print('Error making API request at: ' + endpoint_url)
-        print('Error: ' + ex)
-        print("Status code: %s" % resp.status_code)
-        print("Canvas response: " + resp.text)
+        print(f'Error making API request at: {page_url}')
+        print(f'Error: {ex}')
+        if resp is not None:
+            print(f'Status code: {resp.status_code}')
+            print(f'Canvas response: {resp.text}')
         raise
 
-    return resp_data
+def _get_pages(page_urls, request_params = None):
+    """Request several pages of results from Canvas API at the same time.
+    Returns list of each page's decoded JSON, in the same order as page_urls.
+    """
+    # Limit how many requests we make to Canvas at once.
+    with ThreadPoolExecutor(max_workers=PREFETCH_THREADS) as executor:
+        return list(executor.map(lambda page_url: _get_page(page_url, request_params)[1], page_urls))
+
+def _page_items(resp_json):
+    """The response might be a list of JSON dictionaries or it may be a single
+    JSON dictionary. Return the items on the page as a list either way.
+    """
+    if isinstance(resp_json, list):
+        return resp_json
+    return [resp_json]
+
+def _remaining_page_urls(resp):
+    """Build URLs for the rest of the pages of a paged result set, using the
+    "next" & "last" links in a response's Link header.
+    Returns empty list if there are no more pages, or None if the page numbers
+    can't be determined, e.g. when Canvas leaves out the last link for expensive queries.
+    """
+    if 'next' not in resp.links:
+        return []
+    next_url = resp.links['next']['url']
+    next_page = PAGE_NUMBER_RE.search(next_url)
+    last_page = PAGE_NUMBER_RE.search(resp.links.get('last', {}).get('url', ''))
+    if (next_page is None) or (last_page is None):
+        return None
+    return [PAGE_NUMBER_RE.sub(rf'\g<1>{page}', next_url)
+            for page in range(int(next_page.group(2)), int(last_page.group(2)) + 1)]
 
 def multipart_post(upload_url, form_data, file_data):
     """Post multipart/file-data to an arbitrary URL.
@@ -118,19 +277,30 @@ def multipart_post(upload_url, form_data, file_data):
     want this to happen automatically, because we usually want to capture the 
     JSON returned with the confirmation URL in a separate step.
     """
-    return requests.post(upload_url, data = form_data, files = file_data, allow_redirects=False)
+    return _SESSION.post(upload_url, data = form_data, files = file_data, allow_redirects=False,
+        headers = UNAUTHENTICATED_HEADERS)
 
 def canvas_post(canvas_url):
     """Make a post request to a Canvas URL.
     Used to query confirmation URL when doing a file upload.
     """
-    resp = requests.post(canvas_url, headers = REQUEST_HEADERS)
-    return resp.json()
+    resp = _SESSION.post(canvas_url)
+    return json_helper.loads(resp.content)
 
 def canvas_get(canvas_url):
     """Make an HTTP get request to a canvas URL.
     Used when querying a status URL when doing a file upload."""
-    return requests.get(canvas_url, headers=REQUEST_HEADERS).json()
+    return json_helper.loads(_SESSION.get(canvas_url).content)
+
+def canvas_get_text(canvas_url, timeout = None):
+    """Make an HTTP get request to a canvas URL, returning the response body undecoded.
+    Used when polling a status URL, where most responses only need a quick look.
+    timeout -- (Optional) Seconds to wait to connect to & hear back from Canvas, instead
+               of DEFAULT_TIMEOUT. The request is tried only once, so the call gives up within the timeout.
+    """
+    if timeout is None:
+        return _SESSION.get(canvas_url).text
+    return _SINGLE_TRY_SESSION.get(canvas_url, timeout=timeout).text
 
 
 ######## Data Entity Retrieval ##########
@@ -141,18 +311,19 @@ def pull_courses():
 
 def pull_course_users(course_id):
     """Retrieve list of JSON users in a course."""
-    return query_endpoint('courses/%s/users' % (course_id))
+    return query_endpoint(f'courses/{course_id}/users')
 
 def pull_course_students(course_id):
     """Retrieve list of JSON users who are students enrolled in course."""
 
     # We just want to see the students
     request_params = {'enrollment_type[]':'student'}
-    return query_endpoint('courses/%s/users' % (course_id), request_params)
+    return query_endpoint(f'courses/{course_id}/users', request_params)
 
 def search_users_by_email(user_email):
-    """Retrieve list of users with email matches."""
-    return query_endpoint('accounts/self/users', {'search_term': user_email})
+    """Generate users with email matches.
+    Remaining pages of results are only requested if the caller keeps iterating."""
+    return iter_endpoint('accounts/self/users', {'search_term': user_email})
 
 
 ######## File & Folder Retrieval ##########
@@ -160,37 +331,57 @@ def search_users_by_email(user_email):
 def pull_folders(user_id):
     """Retrieve JSON collection describing all user's folders
     """
-    return query_endpoint('users/%s/folders' % (user_id))
+    return query_endpoint(f'users/{user_id}/folders')
+
+def resolve_folder_path(user_id, folder_path):
+    """Retrieve JSON describing the user's folder at a path relative to their root folder,
+    in a single request instead of listing all the user's folders.
+    Return None if there is no folder at that path.
+    """
+    endpoint_url = f'{BASE_URL}users/{user_id}/folders/by_path/{quote(folder_path)}'
+    resp = _SESSION.get(endpoint_url)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+
+    # Canvas returns every folder along the path, starting with the root folder.
+    return json_helper.loads(resp.content)[-1]
 
 def create_folder(user_id, parent_folder_path, folder_name):
     """Create folder in for Canvas user.
     Return JSON describing the newly created folder.
     """
     # Must masquerade as the user to create a folder for them.
-    endpoint_url = BASE_URL + ('users/%s/folders?as_user_id=%s' % (user_id, user_id))
+    endpoint_url = f'{BASE_URL}users/{user_id}/folders?as_user_id={user_id}'
     form_data = {
         'name': folder_name,
         'parent_folder_path': parent_folder_path }
-    resp = requests.post(endpoint_url, data = form_data, headers = REQUEST_HEADERS)
-    return resp.json()
+    resp = _SESSION.post(endpoint_url, data = form_data)
+    return json_helper.loads(resp.content)
 
 def delete_folder(user_id, folder_id):
     """Delete Canvas folder, including any files inside.
     Return JSON describing the deleted folder.
     """
     # Must masquerade as the user to delete their folders.
-    endpoint_url = BASE_URL + ('folders/%s?as_user_id=%s&force=true' % (folder_id, user_id))
-    resp = requests.delete(endpoint_url, headers=REQUEST_HEADERS)
-    return resp.json()
+    endpoint_url = f'{BASE_URL}folders/{folder_id}?as_user_id={user_id}&force=true'
+    resp = _SESSION.delete(endpoint_url)
+    return json_helper.loads(resp.content)
 
 def pull_files(folder_id):
     """Retrieve JSON collection listing files in the folder.
     """
-    return query_endpoint('folders/%s/files' % (folder_id))
+    return query_endpoint(f'folders/{folder_id}/files')
 
-def pull_file(file_id):
-    """Retrieve JSON for a single file upload."""
-    return query_endpoint('files/%s' % (file_id))
+def pull_file(file_id, timeout = None):
+    """Retrieve JSON for a single file upload.
+    timeout -- (Optional) Seconds to wait to connect to & hear back from Canvas,
+               instead of DEFAULT_TIMEOUT. The request is tried only once, so
+               the call gives up within the timeout.
+    """
+    if timeout is None:
+        return query_endpoint(f'files/{file_id}')
+    return _page_items(_get_page(f'{BASE_URL}files/{file_id}', timeout=timeout, session=_SINGLE_TRY_SESSION)[1])
 
 def pull_user_files(user_id):
     """Retrieve JSON describing a user's file uploads."""
@@ -198,17 +389,17 @@ def pull_user_files(user_id):
     # Include the user information.
     #request_params = { 'include[]':'usage_rights' } 
     # request_params = { 'include[]':'user' }
-    return query_endpoint('users/%s/files/' % (user_id))
+    return query_endpoint(f'users/{user_id}/files/')
 
 def pull_files_quota(user_id):
     """Retrieve file quota for the user."""
     # Must masquerade as the user to see their file quota.
-    return query_endpoint('users/%s/files/quota' % (user_id), {'as_user_id':user_id})[0]['quota']
+    return query_endpoint(f'users/{user_id}/files/quota', {'as_user_id':user_id})[0]['quota']
 
 def pull_quota_info(user_id):
     """Retrieve total & used storage quota for the user."""
     # Must masquerade as the user to see their file quota.
-    return query_endpoint('users/%s/files/quota' % (user_id), {'as_user_id':user_id})[0]
+    return query_endpoint(f'users/{user_id}/files/quota', {'as_user_id':user_id})[0]
 
 ######## File Upload Functions ##########
 
@@ -220,7 +411,7 @@ def initiate_file_upload(user_id, folder_id, display_name, file_size = None):
     file_size -- Size in bytes of file to upload. (optional)
     """
     # Must masquerade as the user to upload a file to their account.
-    endpoint_url = BASE_URL + ('users/%s/files?as_user_id=%s' % (user_id, user_id))
+    endpoint_url = f'{BASE_URL}users/{user_id}/files?as_user_id={user_id}'
     
     form_data = {
         'name': display_name,
@@ -228,10 +419,10 @@ def initiate_file_upload(user_id, folder_id, display_name, file_size = None):
     if (file_size is not None):
         form_data['size'] = file_size
 
-    resp = requests.post(endpoint_url, data = form_data, headers = REQUEST_HEADERS)
-    return resp.json()
+    resp = _SESSION.post(endpoint_url, data = form_data)
+    return json_helper.loads(resp.content)
 
-def initiate_file_upload_via_url(user_id, folder_path, source_url, display_name, file_size = None, content_type = None):
+def initiate_file_upload_via_url(user_id, folder_path, source_url, display_name, file_size = None, content_type = None, log_record = None):
 # def initiate_file_upload_via_url(user_id, folder_id, source_url, display_name, file_size = None, content_type = None):
     """Initiate a file upload via URL.
     user_id -- Canvas ID of user whose account we want to upload to.
@@ -241,9 +432,11 @@ def initiate_file_upload_via_url(user_id, folder_path, source_url, display_name,
     display_name -- Name we want to show for uploaded file in Canvas UI.
     file_size -- (Optional) Hint for size of file in bytes.
     content_type -- (Optional) Hint for file content type.
+    log_record -- (Optional) Dictionary to add Canvas's responses to, for the caller to log.
+                  If not given, the responses are printed.
     """
     # Must masquerade as the user to upload a file to their account.
-    endpoint_url = BASE_URL + ('users/%s/files?as_user_id=%s' % (user_id, user_id))
+    endpoint_url = f'{BASE_URL}users/{user_id}/files?as_user_id={user_id}'
     
     form_data = {
         'url' : source_url,
@@ -258,26 +451,52 @@ def initiate_file_upload_via_url(user_id, folder_path, source_url, display_name,
     if content_type is not None:
         form_data['content_type'] = content_type
 
-    resp = requests.post(endpoint_url, data = form_data, headers = REQUEST_HEADERS)
-    # print('endpoint: %s status code: %s' % (endpoint_url, resp.status_code))
-    respJson = resp.json()
-    print(respJson)
+    # Failing to connect means Canvas never got the request. A read timeout or a
+    # connection dropped after connecting means it may have, & may have started the upload.
+    try:
+        resp = _SESSION.post(endpoint_url, data = form_data)
+    except requests.exceptions.ConnectionError as ex:
+        if _is_connect_failure(ex):
+            raise TransientCanvasError(f'Canvas file upload request failed: {ex}')
+        raise UploadRequestException(f'Canvas file upload request failed: {ex}')
+    except requests.exceptions.Timeout as ex:
+        raise UploadRequestException(f'Canvas file upload request timed out: {ex}')
+    # print(f'endpoint: {endpoint_url} status code: {resp.status_code}')
+    if resp.status_code in TRANSIENT_STATUS_CODES:
+        raise TransientCanvasError(f'Canvas file upload request failed with status code: {resp.status_code} response: {resp.text}')
+    if resp.status_code >= 500:
+        raise UploadRequestException(f'Canvas file upload request failed with status code: {resp.status_code} response: {resp.text}')
+    respJson = json_helper.loads(resp.content)
+    _log_value(log_record, 'canvas_resp', respJson)
 
     # 11.19.2018 tps Upload behavior has a possible step 2 which we might need to do.
     if 'upload_url' in respJson:
-        print("Initiate upload delegation")
-        resp2 = requests.post(respJson['upload_url'], data=respJson['upload_params'])
+        # The response to the 1st request includes a progress object whether or not this
+        # post has been made, but it's this post that starts the transfer, so it can't be skipped.
+        # The session's default timeout gives up if the upload service doesn't respond,
+        # rather than waiting until the Lambda function times out.
+        try:
+            resp2 = _SESSION.post(respJson['upload_url'], data=respJson['upload_params'],
+                headers=UNAUTHENTICATED_HEADERS)
+        except requests.exceptions.ConnectionError as ex:
+            if _is_connect_failure(ex):
+                raise UploadDelegationException(f'Canvas upload delegation failed: {ex}')
+            raise UploadRequestException(f'Canvas upload delegation failed: {ex}')
+        except requests.exceptions.Timeout as ex:
+            raise UploadRequestException(f'Canvas upload delegation timed out: {ex}')
 
         # 12.07.2018 tps Sometimes this post fails with a 502 bad gateway error
-        print('status code: %s response: %s' % (resp2.status_code, resp2.text))
-        if (resp2.status_code == 502):
-            raise UploadDelegationException('Canvas upload delegation failed with status code: %s response: %s' % (resp2.status_code, resp2.text))
+        _log_value(log_record, 'delegation_status', resp2.status_code)
+        if (resp2.status_code in TRANSIENT_STATUS_CODES):
+            raise UploadDelegationException(f'Canvas upload delegation failed with status code: {resp2.status_code} response: {resp2.text}')
+        if (resp2.status_code >= 500):
+            raise UploadRequestException(f'Canvas upload delegation failed with status code: {resp2.status_code} response: {resp2.text}')
 
         # API return value expected to be either a valid file descriptor or an error.
         # Report the error to the client. Otherwise, client needs the response to the
         # 1st request, which contains the progress URL.
-        resp2json = resp2.json()
-        print(resp2json)
+        resp2json = json_helper.loads(resp2.content)
+        _log_value(log_record, 'delegation_resp', resp2json)
         if ('error' in resp2json):
             respJson = resp2json
 
@@ -1,8 +1,15 @@
 """Module for helper functions that wrap Canvas API call.
 06.15.2017 tps Created. Python 2.7.
+10.14.2026 agt Cache user ID & quota lookups for the life of a warm Lambda container.
+10.14.2026 agt Port to Python 3.
+10.14.2026 agt Match quota error message anywhere in the string, ignoring case.
+10.14.2026 agt Limit size of caches.
 """
 import canvas_api
 
+import re
+import time
+
 ######## Constants ##########
 
 # 06.14.2017 Beginning of error message returned by Canvas API for file upload
@@ -11,6 +18,24 @@ import canvas_api
 # file upload or polling a status URL.
 QUOTA_MESSAGE = 'file size exceeds quota'
 
+# Matches the quota error message anywhere in an error string, regardless of case.
+QUOTA_RE = re.compile(re.escape(QUOTA_MESSAGE), re.IGNORECASE)
+
+# Number of seconds to remember results of Canvas API lookups. Lambda reuses
+# containers between invocations, so cached values can outlive a single upload.
+USER_ID_CACHE_TTL = 600
+QUOTA_CACHE_TTL = 300
+
+# Maximum number of values to keep in each cache, so a long-lived container
+# that sees many different users doesn't keep growing.
+CACHE_MAX_SIZE = 1024
+
+
+######## Module Caches ##########
+
+_USER_ID_CACHE = {}     # Key is user email, value is (Canvas user ID, expiration time).
+_QUOTA_CACHE = {}       # Key is Canvas user ID, value is (quota info, expiration time).
+
 
 ######## Custom Validation Exceptions ##########
 
@@ -18,39 +43,81 @@ class UserNotFoundException(Exception):
     pass
 
 
+######## Cache Functions ##########
+
+def get_cached(cache, key):
+    """Retrieve value stored in a cache dictionary.
+    Returns None if there is no value for the key or it has expired.
+    """
+    entry = cache.get(key)
+    if (entry is not None) and (entry[1] > time.monotonic()):
+        return entry[0]
+    return None
+
+def set_cached(cache, key, value, ttl):
+    """Store value in a cache dictionary for ttl seconds.
+    If the cache is full, make room by dropping expired values, then the oldest values.
+    """
+    if (key not in cache) and (len(cache) >= CACHE_MAX_SIZE):
+        now = time.monotonic()
+        for (stale_key, entry) in list(cache.items()):
+            if entry[1] <= now:
+                cache.pop(stale_key, None)
+
+        # Dictionaries keep insertion order, so the first key is the oldest.
+        while cache and (len(cache) >= CACHE_MAX_SIZE):
+            cache.pop(next(iter(cache)), None)
+
+    cache[key] = (value, time.monotonic() + ttl)
+
+
 ######## Modules Functions ##########
 
 def get_canvas_user_id(user_email):
     """Retrieve the Canvas user ID associated with the given email.
-    Throw exception if no match found."""
-    search_results = canvas_api.search_users_by_email(user_email)
-    user_id = find_exact_match_for_login_id(search_results, user_email)
+    Throw exception if no match found. Users who aren't found are never cached,
+    so a user created after a failed lookup is found on the next try."""
+    user_id = get_cached(_USER_ID_CACHE, user_email)
     if user_id is None:
-        raise UserNotFoundException('User %s not found.' % user_email)
+        search_results = canvas_api.search_users_by_email(user_email)
+        user_id = find_exact_match_for_login_id(search_results, user_email)
+        if user_id is None:
+            raise UserNotFoundException('User %s not found.' % user_email)
+        set_cached(_USER_ID_CACHE, user_email, user_id, USER_ID_CACHE_TTL)
     return user_id
 
 def find_exact_match_for_login_id(search_results, target_login_id):
     """The Canvas user search API results do not return only exact matches,
     so this function filters search results for an exact match only.
 
-    search_results -- List of user objects returned by Canvas user search API.
+    search_results -- Iterable of user objects returned by Canvas user search API.
     target_login_id -- Canvas login ID that we want to find an exact match for.
 
     Returns Canvas ID of matching user or None if no exact match is found.
     """
-    return_dict = { user['login_id']: user['id'] for user in search_results}
-    return return_dict.get(target_login_id)
+    # Stop looking as soon as we find the match.
+    return next((user['id'] for user in search_results if user['login_id'] == target_login_id), None)
+
+def get_quota_info(user_id):
+    """Retrieve total & used storage quota for the user.
+    The value may be a few minutes old."""
+    quota_info = get_cached(_QUOTA_CACHE, user_id)
+    if quota_info is None:
+        quota_info = canvas_api.pull_quota_info(user_id)
+        set_cached(_QUOTA_CACHE, user_id, quota_info, QUOTA_CACHE_TTL)
+    return quota_info
 
 def is_quota_exceeded_msg(msg):
-    """Test if user's file quota was exceeded by seeing if message string corresponds
-    to Canvas API error message for file upload error due to exceeding user's file quota.
+    """Test if user's file quota was exceeded by seeing if message string contains
+    the Canvas API error message for file upload error due to exceeding user's file quota.
+    Canvas returns variations like "file size exceeds quota limits", so match anywhere in the string.
     """
-    return msg.startswith(QUOTA_MESSAGE)
+    return QUOTA_RE.search(msg) is not None
 
 def make_quota_exceeded_message(user_id):
     """Build an error message meant to be returned when file upload fails
     due to quota limit exceeded on user's account.
     """
-    quota_info = canvas_api.pull_quota_info(user_id)
+    quota_info = get_quota_info(user_id)
     return "File size exceeds quota. Quota: {0:,d} bytes. Quota used: {1:,d} bytes.". \
         format(quota_info['quota'], quota_info['quota_used'])
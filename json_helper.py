@@ -0,0 +1,39 @@
+"""Helper module for encoding & decoding JSON.
+Uses orjson, which is several times faster than the standard library for large
+Canvas API responses, if it's installed. Otherwise falls back on the json module.
+
+10.14.2026 agt Created.
+10.14.2026 agt Add dumps_bytes() for request bodies. Allow a default function for values
+               that aren't JSON serializable.
+"""
+
+try:
+    import orjson     # https://github.com/ijl/orjson
+except ImportError:
+    orjson = None
+    import json
+
+
+######## JSON Functions ##########
+
+def loads(data):
+    """Decode JSON from a string or bytes, such as an HTTP response's content."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj, default=None):
+    """Encode an object as a JSON string.
+    default -- Function called for values that can't otherwise be serialized. (Optional)
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=default).decode()
+    return json.dumps(obj, default=default)
+
+def dumps_bytes(obj, default=None):
+    """Encode an object as UTF-8 JSON bytes, such as a request or Lambda payload body.
+    orjson produces bytes, so this skips building an intermediate string.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=default)
+    return json.dumps(obj, default=default).encode()
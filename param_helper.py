@@ -1,5 +1,6 @@
 """Helper module for validating required function parameters.
 05.16.2017 tps Created. Python 2.7.
+10.14.2026 agt Port to Python 3.
 """
 
 ######## Custom Validation Exceptions ##########
@@ -20,7 +21,7 @@ def validate(parameter_dictionary, parameter_name):
     if parameter_name not in parameter_dictionary:
         raise MissingParameterException('Missing "%s" parameter.' % parameter_name)
     parameter_value = parameter_dictionary[parameter_name]
-    if not isinstance(parameter_value, basestring):
+    if not isinstance(parameter_value, str):
         raise ParameterTypeException('"%s" parameter is not a string.' % parameter_name)
     return parameter_value
 
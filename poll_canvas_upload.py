@@ -5,7 +5,15 @@
 Accepts a dictionary requiring the following keys:
 
 status_url -- String containing Canvas upload status URL.
+status_urls -- Alternative to status_url. List of Canvas upload status URLs, which are
+               polled at the same time. Each upload is handled as though the function had been
+               called separately with that status_url, including the POST to the callback URL.
+               At most MAX_POLL_THREADS are polled at once. The rest are polled as threads
+               free up, for what's left of MAX_WAIT, & come back STATUS_PENDING if that runs out.
 callback_url -- Optional. String. Do HTTP POST of results of polling to this URL.
+batch_callback -- Optional. Used with status_urls. If true, wait until all the uploads are done &
+                  report them to the callback URL in a single JSON POST, as described in
+                  callback_helper.make_batched_callback_post().
 user_email -- Optional. String containing email address specifying user whose account
               we are doing the upload for. If specified, this is used to return the account's
               file quota information if the file quota is reached.
@@ -23,6 +31,13 @@ status_msg -- If status_flag is STATUS_READY, this is the JSON string returned b
               if status_flag is STATUS_QUOTA_EXCEEDED, this is a message specifying the account's
               quota limit.
 
+If status_urls was given, returns a list of these dictionaries, in the same order as status_urls.
+
+Can also be triggered by an SQS queue, in which case each message body is a JSON parameter
+dictionary as described above. The messages in a batch are polled at the same time. Returns
+a partial batch response listing the messages that aren't JSON parameter dictionaries, & those
+whose polls failed with unexpected errors that couldn't be reported to a callback URL.
+
 
 
 05.15.2017 tps Created from upload_url_to_canvas.py. Python 2.7 
@@ -48,23 +63,75 @@ status_msg -- If status_flag is STATUS_READY, this is the JSON string returned b
     }
   }
 
+10.14.2026 agt Poll with exponential backoff instead of a fixed interval, so fast uploads
+    are reported sooner.
+10.14.2026 agt Accept a list of status URLs to poll concurrently in a single invocation.
+10.14.2026 agt Port to Python 3.
+10.14.2026 agt Make the callback from a single place for all expected outcomes.
+10.14.2026 agt Skip decoding status URL responses while the upload is pending.
+10.14.2026 agt Only describe unexpected exceptions when there's a callback URL to report them to.
+10.14.2026 agt Limit how long a completed upload waits for its file descriptor.
+10.14.2026 agt Use monotonic clock for polling deadline.
+10.14.2026 agt Encode & decode JSON with json_helper.
+10.14.2026 agt Optionally report results of polling several status URLs in a single callback.
+10.14.2026 agt Let callers choose how long poll() waits, so upload_url_to_canvas.py can poll in-process.
+10.14.2026 agt Poll at scheduled times looked up from a table, & log upload durations.
+10.14.2026 agt Accept batches of uploads to poll from an SQS queue.
+10.14.2026 agt Log stack traces of errors from polls started by SQS messages.
+10.14.2026 agt Limit the number of threads poll_many() uses, & log its unexpected errors instead
+               of raising them, so Lambda doesn't retry polls that were already reported.
+10.14.2026 agt Limit the number of threads poll_records() uses, the same way as poll_many().
+10.14.2026 agt Time out the file descriptor request itself, instead of waiting on a shared thread pool.
+10.14.2026 agt Log how long the upload took according to Canvas, not just how long this call polled.
+10.14.2026 agt poll() accepts a timeout for status requests, for callers with little time to spare.
+10.14.2026 agt Only return SQS messages to the queue if they can't be polled or their error wasn't
+               reported to a callback URL, so clients don't get the same error twice.
 """
 
 import callback_helper
 import canvas_api
 import canvas_api_helper
+import json_helper
 import param_helper
 
-import json
+import requests
+
+import bisect
+import random
 import time
-import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 ######## Constants ##########
 
-WAIT_INTERVAL = 15  # Number of seconds to wait between polling for status.
+# Number of seconds after polling starts at which to poll the status URL again.
+# Polls are bunched up early, since many uploads finish quickly. The times are where
+# waits starting at 1 second & doubling up to WAIT_INTERVAL would place them. Once enough
+# upload durations have been logged, they can be replaced by times placed to minimize the
+# expected delay in noticing an upload has finished, given the observed distribution.
+POLL_SCHEDULE = [1, 3, 7, 15, 30]
+WAIT_INTERVAL = 15  # Number of seconds to wait between polling for status after POLL_SCHEDULE runs out.
+WAIT_JITTER = 0.5   # Maximum random number of seconds added to each wait, so that many
+                    # Lambdas started at the same time don't poll Canvas in lockstep.
 MAX_WAIT = 240  # Maximum number of seconds to wait for upload to complete.
                 # Maximum timeout for Lambda function is 5 minutes.
 
+# Maximum number of status URLs polled at the same time by one invocation. Each polling
+# thread needs its own connection to Canvas, so this matches the session's connection pool.
+MAX_POLL_THREADS = canvas_api.POOL_MAXSIZE
+
+FILE_DESCRIPTOR_WAIT = 5    # Number of seconds to wait to connect to & hear back from Canvas for the
+                            # file descriptor of a completed upload before reporting the upload without it.
+                            # The request isn't retried, so this costs at most twice this many seconds.
+
+# Workflow states of an upload that hasn't finished yet.
+PENDING_STATES = ('queued', 'running')
+
+# Text that appears in a status URL response for an upload that hasn't finished yet.
+# Canvas returns compact JSON. If it ever doesn't, we just fall back to decoding every response.
+PENDING_STATUS_MARKERS = tuple('"workflow_state":"%s"' % state for state in PENDING_STATES)
+
+
 ######## Custom Validation Exceptions ##########
 
 class UploadTimeoutException(Exception):
@@ -73,17 +140,63 @@ class UploadTimeoutException(Exception):
 class CanvasUploadException(Exception):
     pass
 
+######## Helper Functions ##########
+
+def wait_for_upload(started, max_wait, status_url):
+    """Give Canvas some time to do its thing before we poll the status URL again.
+    Raise exception if we can't keep waiting any longer.
+
+    started -- time.monotonic() value when we started polling.
+    max_wait -- Number of seconds to wait for the upload to complete.
+    status_url -- Canvas upload status URL, for the error message.
+    """
+    elapsed_s = time.monotonic() - started
+    if elapsed_s >= max_wait:    # Can't keep waiting any longer.
+        raise UploadTimeoutException(
+            'File upload still pending after more than %s seconds. Status URL: %s'
+            % (max_wait, status_url))
+
+    # Find the next scheduled poll.
+    index = bisect.bisect_right(POLL_SCHEDULE, elapsed_s)
+    if index < len(POLL_SCHEDULE):
+        sleep_s = POLL_SCHEDULE[index] - elapsed_s
+    else:
+        sleep_s = WAIT_INTERVAL
+
+    # Don't sleep past the deadline, so the last poll happens right when time runs out.
+    time.sleep(min(max_wait - elapsed_s, sleep_s + random.uniform(0, WAIT_JITTER)))
+
 ######## Main Function ##########
 
-def poll(param_dict):
+def get_upload_duration(status_resp):
+    """Number of seconds from when Canvas created an upload's progress object to its last update,
+    which for a finished upload is how long the upload took. None if the timestamps are missing.
+    """
+    try:
+        created_at = datetime.fromisoformat(status_resp['created_at'])
+        updated_at = datetime.fromisoformat(status_resp['updated_at'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (updated_at - created_at).total_seconds()
+
+
+def poll(param_dict, post_callback=True, max_wait=MAX_WAIT, request_timeout=None):
     """Stop waiting when either the upload status is no longer pending
     or we run out of time to wait.
+
+    post_callback -- If False, leave reporting the outcome to the caller.
+                     Unexpected exceptions are still reported to the callback URL right away.
+    max_wait -- Number of seconds to wait for the upload to complete.
+    request_timeout -- (Optional) Seconds to wait to connect to & hear back from Canvas for each
+                       status request, which isn't retried. A failed status request then reports
+                       the upload as pending, so the caller can hand off polling.
     """
-    max_wait_time = time.time() + MAX_WAIT
+    started = time.monotonic()
 
     print(param_dict)   # Show parameters, for diagnostic purposes.
 
-    return_dict = {}    # Populate with return values.
+    # Populate with the outcome to report to the client.
+    status_flag, status_msg = None, None
 
     # See if client provided a callback URL, which we can use to report
     # errors & transfer status.
@@ -98,8 +211,23 @@ def poll(param_dict):
         upload_status = None  # Populate with final upload status from Canvas API.
         while True:
             # Check on the status of the upload.
-            status_resp = canvas_api.canvas_get(status_url)
-            print(status_resp)
+            try:
+                status_body = canvas_api.canvas_get_text(status_url, request_timeout)
+            except requests.exceptions.RequestException as ex:
+                if request_timeout is None:
+                    raise
+                # The caller is short on time, so leave trying again to whoever polls next.
+                raise UploadTimeoutException(
+                    'Status URL request failed: %s Status URL: %s' % (ex, status_url))
+            print(status_body)
+
+            # While the upload is pending, the workflow_state is all we need from
+            # the response, so don't bother decoding the JSON.
+            if any(marker in status_body for marker in PENDING_STATUS_MARKERS):
+                wait_for_upload(started, max_wait, status_url)
+                continue
+
+            status_resp = json_helper.loads(status_body)
 
             # 11.19.2018 tps No documented errors are returned by the Canvas API's progress URL.
 
@@ -136,50 +264,42 @@ def poll(param_dict):
             # upload_status = status_resp['upload_status']
             upload_status = status_resp['workflow_state']
             # if upload_status != 'pending':      # Done waiting?
-            if upload_status not in ('queued', 'running'):       # Stop waiting when we've reached an end state
+            if upload_status not in PENDING_STATES:       # Stop waiting when we've reached an end state
                 break
 
-            if time.time() > max_wait_time:     # Can't keep waiting any longer.
-                raise UploadTimeoutException(
-                    'File upload still pending after more than %s seconds. Status URL: %s'
-                    % (MAX_WAIT, status_url))
+            wait_for_upload(started, max_wait, status_url)
 
-            # Give Canvas some time to do its thing.
-            time.sleep(WAIT_INTERVAL)
+        # Log how long uploads take, to tune POLL_SCHEDULE. This call may have started polling
+        # partway through the upload, so the upload's own timestamps give its duration.
+        print('Upload reached workflow_state %s. Upload duration: %s seconds. Polling time: %.1f seconds.'
+              % (upload_status, get_upload_duration(status_resp), time.monotonic() - started))
 
         # If we got this far, workflow status should be "complete" or "failed"
         if upload_status == 'completed':
             # Inform client of normal upload result.
             # Return the file descriptor of the upload, which means another call to Canvas,
             # which means another chance for an error.
-            statusMsg = ''  # We'll fill this in later
+            status_flag = callback_helper.STATUS_READY
             try:
-                fileDescriptor = canvas_api.pull_file(status_resp['results']['id'])[0]
-                statusMsg = json.dumps(fileDescriptor)
+                # Don't hold up the callback for long if Canvas is slow to answer.
+                fileDescriptor = canvas_api.pull_file(status_resp['results']['id'], FILE_DESCRIPTOR_WAIT)[0]
+                status_msg = json_helper.dumps(fileDescriptor)
             except Exception as ex:
                 # Log the error so we can diagnose it later
                 print('Error getting file descriptor for successful upload: %s %s' % (type(ex), ex))
 
                 # Let client know something went wrong, even though this isn't a fatal error.
-                statusMsg = "Error when trying to retrieve Canvas file descriptor for the upload."
-
-            return_dict = callback_helper.make_callback_dictionary(
-                param_dict, callback_helper.STATUS_READY, statusMsg)
-            callback_helper.make_callback_post(callback_url, return_dict)
+                status_msg = "Error when trying to retrieve Canvas file descriptor for the upload."
 
         elif upload_status == 'failed':
             # Haven't been able to make this condition occur,
             # but assume there'd be a useful message.
-            err_msg = status_resp['message']
-            return_dict = callback_helper.make_callback_dictionary(
-                param_dict, callback_helper.STATUS_ERROR, err_msg)
-            callback_helper.make_callback_post(callback_url, return_dict)
+            status_flag = callback_helper.STATUS_ERROR
+            status_msg = status_resp['message']
 
         else:   # If we got here, we got an unknown workflow state, so I really don't know what to do.
-            err_msg = "Progress URL returned unknown workflow_state of %s." % upload_status
-            return_dict = callback_helper.make_callback_dictionary(
-                param_dict, callback_helper.STATUS_ERROR, err_msg)
-            callback_helper.make_callback_post(callback_url, return_dict)
+            status_flag = callback_helper.STATUS_ERROR
+            status_msg = "Progress URL returned unknown workflow_state of %s." % upload_status
 
 
         # if upload_status == 'ready':
@@ -210,9 +330,7 @@ def poll(param_dict):
 
     except UploadTimeoutException as ex:
         # We had to quit because the upload was taking too long.
-        return_dict = callback_helper.make_callback_dictionary(
-            param_dict, callback_helper.STATUS_PENDING, ex.message)
-        callback_helper.make_callback_post(callback_url, return_dict)
+        status_flag, status_msg = callback_helper.STATUS_PENDING, str(ex)
 
     except (param_helper.MissingParameterException,
             param_helper.ParameterTypeException,
@@ -222,36 +340,136 @@ def poll(param_dict):
         print('%s %s' % (type(ex), ex))
 
         # Report the error to the callback URL
-        return_dict = callback_helper.make_callback_dictionary(
-            param_dict, callback_helper.STATUS_ERROR, ex.message)
-        callback_helper.make_callback_post(callback_url, return_dict)
+        status_flag, status_msg = callback_helper.STATUS_ERROR, str(ex)
 
     except Exception as ex:
         # Attempt to report unexpected exception to callback
-        # and to default error handler.
-
-        # Build a description for the unexpected exception.
-        error_description = '\n'.join((
-            'Exception type: %s' % type(ex),
-            'Exception: %s' % ex,
-            traceback.format_exc()
-        ))
+        # and to default error handler. The default error handler logs the
+        # stack trace itself, so only describe the exception if there's a callback.
+        if callback_url:
+            # Build a description for the unexpected exception.
+            error_description = callback_helper.describe_exception(ex)
 
-        # Log the unexpected exception. We do this now because the following
-        # attempt to make the callback might itself throw another exception.
-        print(error_description)
+            # Log the unexpected exception. We do this now because the following
+            # attempt to make the callback might itself throw another exception.
+            print(error_description)
 
-        # Report the error to the callback URL
-        return_dict = callback_helper.make_callback_dictionary(
-            param_dict, callback_helper.STATUS_ERROR, error_description)
-        callback_helper.make_callback_post(callback_url, return_dict)
+            # Report the error to the callback URL now, since we won't reach the callback below.
+            return_dict = callback_helper.make_callback_dictionary(
+                param_dict, callback_helper.STATUS_ERROR, error_description)
+            callback_helper.make_callback_post(callback_url, return_dict)
 
         # Let the default error handler see this error.
         raise
 
+    # Report the outcome to the callback URL
+    return_dict = callback_helper.make_callback_dictionary(param_dict, status_flag, status_msg)
+    if post_callback:
+        callback_helper.make_callback_post(callback_url, return_dict)
     return return_dict
 
+def poll_until(param_dict, post_callback, deadline):
+    """Poll for the upload status for whatever time is left before the deadline, a time.monotonic()
+    value shared by all the polls in an invocation. Polls at least once, even if the deadline has passed.
+    """
+    return poll(param_dict, post_callback, max_wait=max(0, deadline - time.monotonic()))
+
+
+def poll_many(param_dict):
+    """Poll several upload status URLs at the same time, each in its own thread.
+    Polling is mostly waiting, so one invocation can keep track of many uploads.
+    Returns list of the return dictionaries from poll(), in the same order as the status URLs.
+    Uploads whose polls raise an unexpected error get a STATUS_ERROR dictionary describing it.
+    """
+    status_urls = param_dict.get('status_urls')
+    if not isinstance(status_urls, list):
+        status_urls = [status_urls]
+
+    # Every upload is polled with the same parameters, except for its status URL.
+    base_params = dict((key, value) for (key, value) in param_dict.items() if key != 'status_urls')
+
+    # Either each poll makes its own callback, or we report them all together at the end.
+    batch_callback = bool(param_dict.get('batch_callback'))
+
+    # Polls waiting for a free thread share the same deadline, so the invocation finishes in time.
+    deadline = time.monotonic() + MAX_WAIT
+    with ThreadPoolExecutor(max_workers=max(1, min(len(status_urls), MAX_POLL_THREADS))) as executor:
+        futures = [executor.submit(poll_until, dict(base_params, status_url=status_url), not batch_callback, deadline)
+                   for status_url in status_urls]
+
+    return_dicts = []       # Populate with return values.
+    callback_dicts = []     # Results for the batched callback. poll() reports its own unexpected errors.
+    for (status_url, future) in zip(status_urls, futures):
+        try:
+            return_dict = future.result()
+            callback_dicts.append(return_dict)
+        except Exception as ex:
+            # poll() already reported the error to the callback URL. Raising would make Lambda
+            # retry the whole event, polling & reporting the other uploads again, so just log
+            # the error. The default error handler never sees it, so include the stack trace.
+            error_description = callback_helper.describe_exception(ex)
+            print(error_description)
+            return_dict = callback_helper.make_callback_dictionary(
+                dict(base_params, status_url=status_url), callback_helper.STATUS_ERROR, error_description)
+        return_dicts.append(return_dict)
+
+    if batch_callback:
+        callback_helper.make_batched_callback_post(param_dict.get('callback_url'), callback_dicts)
+
+    return return_dicts
+
+
+def poll_records(records):
+    """Poll for the uploads in a batch of SQS messages at the same time, each in its own thread.
+    Returns a partial batch response listing the messages to return to the queue: those that
+    aren't JSON parameter dictionaries, & those whose polls raised unexpected errors without
+    a callback URL to report them to. Messages whose errors were reported to their callback
+    URLs aren't returned, since polling them again would report the error again.
+    If the queue's event source mapping reports batch item failures, only the listed messages
+    are returned to the queue; otherwise the batch is considered processed.
+    """
+    failures = []   # Messages to return to the queue.
+
+    # A message we can't read will never succeed. Returning it to the queue lets the
+    # queue's redrive policy move it to the dead-letter queue, where someone can look at it.
+    polled = []     # (record, param_dict) for the messages to poll.
+    for record in records:
+        try:
+            param_dict = json_helper.loads(record['body'])
+        except ValueError:
+            param_dict = None
+        if not isinstance(param_dict, dict):
+            print('SQS message %s is not a JSON parameter dictionary: %s' % (record['messageId'], record['body']))
+            failures.append({'itemIdentifier': record['messageId']})
+            continue
+        polled.append((record, param_dict))
+
+    # Messages waiting for a free thread share the same deadline, so the invocation finishes in time.
+    deadline = time.monotonic() + MAX_WAIT
+    with ThreadPoolExecutor(max_workers=max(1, min(len(polled), MAX_POLL_THREADS))) as executor:
+        futures = [executor.submit(poll_until, param_dict, True, deadline) for (record, param_dict) in polled]
+
+    for ((record, param_dict), future) in zip(polled, futures):
+        try:
+            future.result()
+        except Exception as ex:
+            # Raising would return the whole batch to the queue, including the messages
+            # already reported to their callback URLs, so just log the error. The default
+            # error handler never sees it, so include the stack trace.
+            print(callback_helper.describe_exception(ex))
+
+            # poll() already reported the error if there's a callback URL. Otherwise
+            # return the message to the queue, so the upload gets polled again.
+            if not param_dict.get('callback_url'):
+                failures.append({'itemIdentifier': record['messageId']})
+
+    return {'batchItemFailures': failures}
+
 ########### Lambda Entry Point ###########
 
 def lambda_handler(event, context):
+    if 'Records' in event:
+        return poll_records(event['Records'])
+    if 'status_urls' in event:
+        return poll_many(event)
     return poll(event)
@@ -15,13 +15,23 @@ callback_url -- String specifying publicly accessible URL which receives a POST
 status_url -- (Optional) String specifying a Canvas upload status URL generated from a previous
                call to this function. If it exists, instead of initiating an upload, continue
                polling the Canvas URL until the upload is ready or an error occurs or a timeout
-               occurs.
+               occurs. Polling is done by this function while it has time left, then handed off
+               to the polling Lambda function.
+
+Alternatively accepts a dictionary with a single key:
+
+batch -- List of parameter dictionaries as described above, uploaded in one invocation.
+         At most MAX_BATCH_SIZE are handled here, & only while there's time left.
+         The rest are passed on to another invocation of this function. Uploads with a
+         status_url are handed off to the polling Lambda function without polling here.
 
 Returns a dictionary containing the original parameters keys plus:
 
 status_url -- String containing Canvas upload status URL.
 status_flag -- Integer flag specifying status of the upload:
                STATUS_ERROR, STATUS_QUOTA_EXCEEDED, STATUS_INITIATED or STATUS_POLLING.
+               If this function finished polling a status URL itself, this is STATUS_READY
+               or STATUS_ERROR, as returned by poll_canvas_upload.py.
 status_msg -- If status_flag is STATUS_ERROR, this is a
               description of the error, possibly including a stack trace.
               If status_flag is STATUS_INITIATED or STATUS_POLLING, this is
@@ -29,6 +39,11 @@ status_msg -- If status_flag is STATUS_ERROR, this is a
               if status_flag is STATUS_QUOTA_EXCEEDED, this is a message specifying the account's
               quota limit.
 
+For a batch, returns a list of these dictionaries, one for each upload handled by this invocation.
+
+An event containing a true keep_warm key, as sent by a scheduled rule to keep a container
+warm, returns {'ok': True} right away.
+
 03.29.2017 tps Created from begin_upload_to_canvas.py (Python 2.7).
 04.03.2017 tps Added handling for different types of error return values from Canvas API
                depending on whether or not a file size hit is provided.
@@ -42,16 +57,47 @@ status_msg -- If status_flag is STATUS_ERROR, this is a
 06.15.2017 tps Moved Canvas user ID lookup functions to canvas_api_helper.py.
 11.15.2018 tps Redo for changed behavior of Canvas API file uploads.
 12.20.2018 tps Catch specific Canvas upload API exception.
+10.14.2026 agt Port to Python 3.
+10.14.2026 agt Only describe unexpected exceptions when there's a callback URL to report them to.
+10.14.2026 agt When given a status URL, poll it in-process while there's time, instead of
+               always launching the polling Lambda function.
+10.14.2026 agt Create the Lambda client once per container.
+10.14.2026 agt Accept a batch of uploads, so they share the cost of one invocation.
+10.14.2026 agt Handle the uploads in a batch concurrently.
+10.14.2026 agt Look up the upload folder by path & cache its ID.
+10.14.2026 agt Encode Lambda payloads with json_helper.
+10.14.2026 agt Optionally hand off polling through an SQS queue instead of invoking the polling function.
+10.14.2026 agt Fail fast on files larger than the user's whole quota, before initiating the upload.
+10.14.2026 agt Look up each field of the upload response once when checking it for errors.
+10.14.2026 agt Log each upload initiation as a single JSON line.
+10.14.2026 agt Retry initiating the upload after transient Canvas errors.
+10.14.2026 agt Get the status URL from the upload response in one step.
+10.14.2026 agt Recognize quota errors in the upload response with canvas_api_helper.is_quota_exceeded_msg().
+10.14.2026 agt Answer scheduled keep warm pings without doing any work.
+10.14.2026 agt Don't retry upload requests that Canvas may have acted on.
+10.14.2026 agt Include Canvas's responses & upload retries in the upload's single log line.
+10.14.2026 agt Stop starting uploads from a batch when time runs low, & hand off the rest in a
+               single call at the end. Log unexpected errors in a batch instead of raising them.
+10.14.2026 agt Hand off status URLs in a batch to the polling function right away, so that
+               polling doesn't hold up the batch's new uploads.
+10.14.2026 agt Split a batch's hand off into payloads small enough for an asynchronous invoke, &
+               report uploads to their callback URLs if any error stops their hand off.
+10.14.2026 agt Leave enough time after polling for the slowest last status request, file descriptor
+               request & callback, & bound each status request polled from here.
+10.14.2026 agt Skip the quota pre-check if the quota can't be looked up, leaving it to Canvas.
 """
 
 import callback_helper
 import canvas_api
 import canvas_api_helper
+import json_helper
 import param_helper
+import poll_canvas_upload
 
 import boto3
-import json
-import traceback
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 ######## Constants ##########
@@ -63,6 +109,67 @@ UPLOAD_FOLDER_FULL_PATH = '/'.join((UPLOAD_FOLDER_PARENT_PATH, UPLOAD_FOLDER_NAM
 
 LAMBDA_ARN = 'arn:aws:lambda:somelambdaarn'    # For Testing
 
+# If set, polling is handed off by sending a message to this SQS queue, which the polling
+# Lambda function consumes, instead of by invoking the polling function directly.
+POLL_QUEUE_URL = None   # e.g. 'https://sqs.us-west-2.amazonaws.com/123456789012/poll-canvas-upload'
+
+# When continuing to poll a status URL, we poll from this function for as long as it has time,
+# & only hand off to the polling Lambda function if the upload is still pending.
+POLL_REQUEST_TIMEOUT = (3, 5)   # Seconds to wait to connect to & hear back from Canvas for each status
+                                # request polled from here. A failed request hands off polling instead.
+
+# Number of seconds of execution time to leave after polling here stops. The last status request
+# can start right as polling time runs out, & may be followed by the file descriptor request, the
+# callback & the hand off, so leave room for the longest each of them can take, plus some slack.
+POLL_TIME_BUFFER = (sum(POLL_REQUEST_TIMEOUT)
+                    + 2 * poll_canvas_upload.FILE_DESCRIPTOR_WAIT
+                    + sum(callback_helper.CALLBACK_TIMEOUT)
+                    + 5)
+MIN_POLL_TIME = 5       # Don't bother polling here with less than this many seconds available.
+
+# Largest number of uploads from a batch handled by one invocation.
+MAX_BATCH_SIZE = 200
+
+# Number of uploads from a batch handled at the same time.
+BATCH_THREADS = 4
+
+# Don't start another upload from a batch with less than this many seconds of execution time
+# left, so it can finish & the rest of the batch can be handed off before the function times out.
+BATCH_TIME_BUFFER = 20
+
+# Largest payload in bytes sent when handing off the rest of a batch. Asynchronous Lambda
+# invocations reject payloads over 256 KB, so leave some room under that.
+MAX_HANDOFF_PAYLOAD = 240 * 1024
+
+# Seconds to remember a user's upload folder ID.
+FOLDER_ID_CACHE_TTL = 3600
+
+# Initiating an upload is retried after transient Canvas errors, which only happen when Canvas
+# can't have started the upload, so a retry never starts a second transfer. Wait RETRY_INITIAL_WAIT
+# seconds before the 1st retry & double the wait up to RETRY_MAX_WAIT, plus up to RETRY_JITTER
+# random seconds, so that many Lambdas failing at the same time don't retry in lockstep.
+UPLOAD_ATTEMPTS = 3
+RETRY_INITIAL_WAIT = 1
+RETRY_MAX_WAIT = 8
+RETRY_JITTER = 1
+
+
+########### AWS Clients ###########
+
+# Creating a client is slow, so create it once per Lambda container & reuse it in warm invocations.
+# _LAMBDA_CLIENT = boto3.client('lambda', region_name = 'us-west-2')    # Shouldn't need to specify region when installed.
+_LAMBDA_CLIENT = boto3.client('lambda')
+_SQS_CLIENT = boto3.client('sqs') if POLL_QUEUE_URL else None
+
+# Uploads spend most of their time waiting on Canvas, so threads let a batch overlap them.
+_BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_THREADS)
+
+
+########### Caches ###########
+
+# Upload folder IDs by Canvas user ID. Kept across warm invocations of the same container.
+_FOLDER_ID_CACHE = {}
+
 
 ######## Custom Validation Exceptions ##########
 
@@ -87,37 +194,144 @@ def get_upload_folder_id(user_id):
     """Retrieve Canvas ID of user's video upload folder.
     Create the upload folder in Canvas if it does not already exist.
     """
-    folder_id = None
-    folder_dict = get_user_folders_dict(user_id)
-    if UPLOAD_FOLDER_FULL_PATH in folder_dict:
-        folder_id = folder_dict[UPLOAD_FOLDER_FULL_PATH]
-    else:
+    folder_id = canvas_api_helper.get_cached(_FOLDER_ID_CACHE, user_id)
+    if folder_id is not None:
+        return folder_id
+
+    # The parent folder is the user's root folder, so the path is just the upload folder's name.
+    folder_json = canvas_api.resolve_folder_path(user_id, UPLOAD_FOLDER_NAME)
+    if folder_json is None:
         folder_json = canvas_api.create_folder(user_id, UPLOAD_FOLDER_PARENT_PATH, UPLOAD_FOLDER_NAME)
-        folder_id = folder_json['id']
+    folder_id = folder_json['id']
+
+    canvas_api_helper.set_cached(_FOLDER_ID_CACHE, user_id, folder_id, FOLDER_ID_CACHE_TTL)
     return folder_id
 
 
+def initiate_file_upload_with_retry(user_id, file_url, display_name, upload_file_size, log_record):
+    """Initiate URL upload, trying again after transient Canvas errors.
+    Raises the last canvas_api.TransientCanvasError if every attempt fails.
+    log_record -- Dictionary to add Canvas's responses & the retried errors to.
+    """
+    for attempt in range(UPLOAD_ATTEMPTS):
+        try:
+            return canvas_api.initiate_file_upload_via_url(user_id, UPLOAD_FOLDER_FULL_PATH, file_url,
+                display_name, upload_file_size, log_record=log_record)
+        except canvas_api.TransientCanvasError as ex:
+            if attempt == UPLOAD_ATTEMPTS - 1:
+                raise
+            wait = min(RETRY_MAX_WAIT, RETRY_INITIAL_WAIT * 2 ** attempt) + random.uniform(0, RETRY_JITTER)
+            log_record.setdefault('retries', []).append(
+                '%s %s Retrying in %.1f seconds.' % (type(ex), ex, wait))
+            time.sleep(wait)
+
+
 
 ########### Main Function ###########
 
-def upload_to_canvas(param_dict):
+def upload_to_canvas(param_dict, context=None):
     return_dict = {}
 
     # If client already provided a status URL,
     # our job is to continue polling the status URL until upload is done.
     # Otherwise, we initiate the upload.
     status_url = param_dict.get('status_url')
-    if isinstance(status_url, basestring) and (status_url != ''):
-        return_dict = initiate_polling(param_dict)
+    if isinstance(status_url, str) and (status_url != ''):
+        return_dict = continue_polling(param_dict, context)
     else:
         return_dict = initiate_upload(param_dict)
     return return_dict
 
 
+def upload_batch(param_dicts, context=None):
+    """Handle a list of uploads in one invocation, so they share its start up costs.
+    Up to MAX_BATCH_SIZE uploads are started, while there's time left. The rest are
+    passed on to another invocation of this function in a single call at the end.
+    Returns list of the return dictionaries for the uploads handled here.
+    Uploads that raise an unexpected error get a STATUS_ERROR dictionary describing it.
+
+    context -- Lambda context object, used to check the time left & find this function's ARN
+               for the hand off. If None, all the uploads are handled here.
+    """
+    if context is None:
+        futures = [_BATCH_EXECUTOR.submit(upload_to_canvas, param_dict) for param_dict in param_dicts]
+        leftover = []
+    else:
+        futures = [_BATCH_EXECUTOR.submit(upload_if_time_left, param_dict, context)
+                   for param_dict in param_dicts[:MAX_BATCH_SIZE]]
+        leftover = param_dicts[MAX_BATCH_SIZE:]
+
+    return_dicts = []   # Populate with return values.
+    not_started = []    # Uploads skipped for lack of time.
+    for (param_dict, future) in zip(param_dicts, futures):
+        try:
+            return_dict = future.result()
+        except Exception as ex:
+            # upload_to_canvas() already reported the error to the callback URL. Raising would
+            # make Lambda retry the whole event, starting the other uploads again, so just log
+            # the error. The default error handler never sees it, so include the stack trace.
+            error_description = callback_helper.describe_exception(ex)
+            print(error_description)
+            return_dict = callback_helper.make_callback_dictionary(
+                param_dict, callback_helper.STATUS_ERROR, error_description)
+
+        if return_dict is None:
+            not_started.append(param_dict)
+        else:
+            return_dicts.append(return_dict)
+
+    # Hand off everything we didn't get to, in as few calls as the payload size limit allows.
+    for handoff_dicts in split_batch(not_started + leftover):
+        try:
+            invoke_lambda(context.invoked_function_arn, {'batch': handoff_dicts})
+        except Exception as ex:
+            # Throttling, network errors & oversized payloads all end up here. Raising would make
+            # Lambda retry the whole event, starting the uploads already handled again, so report
+            # the uploads we couldn't hand off to their callback URLs instead.
+            print(callback_helper.describe_exception(ex))
+            for param_dict in handoff_dicts:
+                callback_helper.make_callback_post(param_dict.get('callback_url'),
+                    callback_helper.make_callback_dictionary(param_dict, callback_helper.STATUS_ERROR, str(ex)))
+
+    return return_dicts
+
+
+def split_batch(param_dicts):
+    """Split a list of uploads into lists whose {'batch': [...]} payloads each fit in MAX_HANDOFF_PAYLOAD bytes.
+    An upload too big to fit by itself gets a list of its own, for the invoke to reject.
+    """
+    empty_size = len(json_helper.dumps_bytes({'batch': []}))
+    batches = []
+    batch, batch_size = [], empty_size
+    for param_dict in param_dicts:
+        item_size = len(json_helper.dumps_bytes(param_dict)) + 2    # Plus separator between items.
+        if batch and (batch_size + item_size > MAX_HANDOFF_PAYLOAD):
+            batches.append(batch)
+            batch, batch_size = [], empty_size
+        batch.append(param_dict)
+        batch_size += item_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def upload_if_time_left(param_dict, context):
+    """Handle an upload from a batch, unless the function is running low on execution time.
+    Returns None without starting the upload if there isn't enough time left.
+    """
+    if context.get_remaining_time_in_millis() / 1000.0 < BATCH_TIME_BUFFER:
+        return None
+
+    # Without the context, a status URL is handed off to the polling function instead of
+    # being polled here, which would tie up one of the batch's few threads until time ran out.
+    return upload_to_canvas(param_dict)
+
+
 def initiate_upload(param_dict):
     return_dict = {}    # Return value
 
-    print(param_dict)   # Log parameter values
+    # Everything we log about this upload, printed as one JSON line when we're done.
+    log_record = {'event': 'initiate_upload', 'params': param_dict}
 
     # See if client provided a callback URL, which we can use to report
     # errors & transfer status.
@@ -135,14 +349,20 @@ def initiate_upload(param_dict):
 
         # Resolve user ID
         user_id = canvas_api_helper.get_canvas_user_id(user_email)
-        print('User ID: %s' % user_id)
-
-        # # Make sure there is enough room to upload the file.
-        # # We might not know the file size.
-        # if upload_file_size is not None:
-        #     quota_size = canvas_api.pull_files_quota(user_id)
-        #     if upload_file_size > quota_size:
-        #         raise FileSizeExceedsQuotaException('File size exceeds user\'s quota.')
+        log_record['user_id'] = user_id
+
+        # Don't bother asking Canvas to upload a file that can never fit in the user's account.
+        # We might not know the file size. The quota information may be a few minutes old,
+        # so leave checking against the space used to Canvas.
+        # The check is only a shortcut, so if the quota can't be looked up, go ahead with the upload.
+        if isinstance(upload_file_size, int):
+            try:
+                quota_size = canvas_api_helper.get_quota_info(user_id)['quota']
+            except Exception as ex:
+                log_record['quota_check_error'] = '%s %s' % (type(ex), ex)
+                quota_size = None
+            if (quota_size is not None) and (upload_file_size > quota_size):
+                raise FileSizeExceedsQuotaException('File size exceeds user\'s quota.')
 
         # Make sure an uploads folder exists for the user.
         # folder_id = get_upload_folder_id(user_id)
@@ -150,8 +370,7 @@ def initiate_upload(param_dict):
 
         # Initiate URL upload
         # resp = canvas_api.initiate_file_upload_via_url(user_id, folder_id, file_url, display_name, upload_file_size)
-        resp = canvas_api.initiate_file_upload_via_url(user_id, UPLOAD_FOLDER_FULL_PATH, file_url, display_name, upload_file_size)
-        print (resp)
+        resp = initiate_file_upload_with_retry(user_id, file_url, display_name, upload_file_size, log_record)
 
         # There's at least 2 ways this API call can fail.
         # If the HTTP response status code is 200, there should be an upload_status
@@ -161,22 +380,25 @@ def initiate_upload(param_dict):
         # when we've provided a file size hint for the upload. In this case we can use
         # the absence of an 'upload_status' key as an error flag.
 
-        # 11.19.2018 tps Check for file quota limit when a size hint was given
-        if ('message' in resp) and (resp['message'] == 'file size exceeds quota'):
-            raise FileSizeExceedsQuotaException(resp['message'])
+        msg = resp.get('message')
+        err = resp.get('error')
+        progress = resp.get('progress')
 
+        # 11.19.2018 tps Check for file quota limit when a size hint was given
         # 11.19.2018 tps Check for file quota limit when a size hint was not given
-        if ('error' in resp) and ('file size exceeds quota limits' in resp['error']):
-            raise FileSizeExceedsQuotaException(resp['error'])
+        # Canvas reports the 1st in the 'message' field & the 2nd in the 'error' field.
+        error_msg = err or msg
+        if isinstance(error_msg, str) and canvas_api_helper.is_quota_exceeded_msg(error_msg):
+            raise FileSizeExceedsQuotaException(error_msg)
 
         # 11.19.2018 tps Some other error from step 2.
-        if ('error' in resp):
-            raise CanvasUploadException(resp['error'])
+        elif err is not None:
+            raise CanvasUploadException(err)
 
         # 11.15.2018 tps Check for reasonable API return status, new behavior
-        if 'progress' not in resp:
-            raise CanvasUploadException("File upload call did not return a progress object.")
-        if 'url' not in resp['progress']:
+        try:
+            status_url = progress['url']
+        except (KeyError, TypeError):
             raise CanvasUploadException("File upload call did not return a progress URL.")
         #? Test for file quota exceeded error
         #? Test for other non-predictable errors reported.
@@ -193,10 +415,9 @@ def initiate_upload(param_dict):
         #     raise CanvasUploadException('Error initiating upload. Canvas returned: %s ' % json.dumps(resp))
 
         # Launch process that polls for upload status
-        poll_params = param_dict.copy()
-        status_url = resp['progress']['url']
         # status_url = resp['status_url']
-        poll_params['status_url'] = status_url
+        log_record['status_url'] = status_url
+        poll_params = dict(param_dict, status_url=status_url)
         return_dict = initiate_polling(poll_params)
 
         # For clients calling synchronously, return status flag indicating this call
@@ -206,7 +427,7 @@ def initiate_upload(param_dict):
 
     except FileSizeExceedsQuotaException as ex:
         # Log the error
-        print('%s %s' % (type(ex), ex))
+        log_record['error'] = '%s %s' % (type(ex), ex)
 
         # Report upload error due to user's file quota exceeded
         err_msg = canvas_api_helper.make_quota_exceeded_message(user_id)
@@ -221,69 +442,106 @@ def initiate_upload(param_dict):
             canvas_api_helper.UserNotFoundException,
             CanvasUploadException,
             LambdaCallException,
-            canvas_api.UploadDelegationException) as ex:
+            canvas_api.TransientCanvasError,
+            canvas_api.UploadRequestException) as ex:
 
         # Log the error
-        print('%s %s' % (type(ex), ex))
+        log_record['error'] = '%s %s' % (type(ex), ex)
 
         # Report the error to the callback URL
         return_dict = callback_helper.make_callback_dictionary(
-            param_dict, callback_helper.STATUS_ERROR, ex.message)
+            param_dict, callback_helper.STATUS_ERROR, str(ex))
         callback_helper.make_callback_post(callback_url, return_dict)
 
     except Exception as ex:
-        # Attempt to report unexpected exception to callback
-        # and to default error handler.
+        # Log the error. The log record is printed even if the following attempt to
+        # make the callback throws another exception.
+        log_record['error'] = '%s %s' % (type(ex), ex)
 
-        # Build a description for the unexpected exception.
-        error_description = '\n'.join((
-            'Exception type: %s' % type(ex),
-            'Exception: %s' % ex,
-            traceback.format_exc()
-        ))
+        # Attempt to report unexpected exception to callback
+        # and to default error handler. The default error handler logs the
+        # stack trace itself, so only describe the exception if there's a callback.
+        if callback_url:
+            # Build a description for the unexpected exception.
+            error_description = callback_helper.describe_exception(ex)
 
-        # Log the unexpected exception. We do this now because the following attempt to
-        # make the callback might itself throw another exception.
-        print(error_description)
-
-        # Report the error to the callback URL
-        return_dict = callback_helper.make_callback_dictionary(
-            param_dict, callback_helper.STATUS_ERROR, error_description)
-        callback_helper.make_callback_post(callback_url, return_dict)
+            # Report the error to the callback URL
+            return_dict = callback_helper.make_callback_dictionary(
+                param_dict, callback_helper.STATUS_ERROR, error_description)
+            callback_helper.make_callback_post(callback_url, return_dict)
 
         # Let the default error handler see this error.
         raise
 
+    finally:
+        log_record['status_flag'] = return_dict.get('status_flag')
+        print(json_helper.dumps(log_record, default=str))
+
+    return return_dict
+
+
+def continue_polling(param_dict, context):
+    """Poll Canvas for the status of a URL file upload from this Lambda function,
+    for as long as its remaining execution time allows. If the upload is still pending
+    when time runs out, launch the polling Lambda function to keep waiting.
+
+    context -- Lambda context object, used to find out how much time is left.
+               If None, hand off to the polling Lambda function right away.
+    """
+    max_wait = 0
+    if context is not None:
+        max_wait = context.get_remaining_time_in_millis() / 1000.0 - POLL_TIME_BUFFER
+    if max_wait < MIN_POLL_TIME:
+        return initiate_polling(param_dict)
+
+    # Wait to make the callback until we know we won't be handing off.
+    return_dict = poll_canvas_upload.poll(param_dict, post_callback=False, max_wait=max_wait,
+                                          request_timeout=POLL_REQUEST_TIMEOUT)
+    if return_dict['status_flag'] == callback_helper.STATUS_PENDING:
+        return initiate_polling(param_dict)
+
+    callback_helper.make_callback_post(param_dict.get('callback_url'), return_dict)
     return return_dict
 
 
 def initiate_polling(lambda_params):
     """Launch the AWS Lambda function that polls Canvas for the status of a URL file upload.
     """
+    if _SQS_CLIENT is not None:
+        # Queue the upload for the polling function to pick up.
+        _SQS_CLIENT.send_message(QueueUrl=POLL_QUEUE_URL, MessageBody=json_helper.dumps(lambda_params))
+    else:
+        invoke_lambda(LAMBDA_ARN, lambda_params)
 
-     # Call Lambda function asynchronously
-    # client = boto3.client('lambda', region_name = 'us-west-2')    # Shouldn't need to specify region when installed.
-    client = boto3.client('lambda')
-    response = client.invoke(
-        FunctionName=LAMBDA_ARN,
+    # If Lambda function called successfully, return the parameter dictionary it was sent.
+    return callback_helper.make_callback_dictionary(
+        lambda_params, callback_helper.STATUS_POLLING, lambda_params['status_url'])
+
+
+def invoke_lambda(function_name, lambda_params):
+    """Call a Lambda function asynchronously with the given event parameters.
+    """
+    response = _LAMBDA_CLIENT.invoke(
+        FunctionName=function_name,
         InvocationType='Event',
-        Payload=json.dumps(lambda_params)
+        Payload=json_helper.dumps_bytes(lambda_params)
     )
 
     # Check for reasonable Lambda call return status
     if response['StatusCode'] not in range(200, 300):
-        raise LambdaCallException('Lambda call returned bad status code: %s ' % json.dumps(response))
+        raise LambdaCallException('Lambda call returned bad status code: %s ' % json_helper.dumps(response, default=str))
 
     # Check for error notification header.
     if 'x-amz-function-error' in response['ResponseMetadata']['HTTPHeaders']:
-        raise LambdaCallException('Lambda call returned x-amz-function-error header: %s' % json.dumps(response))
-
-    # If Lambda function called successfully, return the parameter dictionary it was sent.
-    return callback_helper.make_callback_dictionary(
-        lambda_params, callback_helper.STATUS_POLLING, lambda_params['status_url'])
+        raise LambdaCallException('Lambda call returned x-amz-function-error header: %s' % json_helper.dumps(response, default=str))
 
 
 ########### Lambda Entry Point ###########
 
 def lambda_handler(event, context):
-    return upload_to_canvas(event)
+    # Scheduled ping to keep this container warm. Nothing to upload.
+    if event.get('keep_warm'):
+        return {'ok': True}
+    if 'batch' in event:
+        return upload_batch(event['batch'], context)
+    return upload_to_canvas(event, context)